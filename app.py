@@ -5,24 +5,74 @@ Now uses browser localStorage for quiz storage
 Users can upload/delete their own quizzes
 """
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
-import json
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, make_response
+from flask.json.provider import DefaultJSONProvider
+from flask_session import Session
+import orjson
+import os
 import uuid
-from datetime import datetime
+from datetime import timedelta
+from functools import lru_cache
+import time
 import random
-import copy
+import re
 import platform
-import qrcode
-from io import BytesIO
-import base64
-import socket
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson for request parsing and jsonify responses"""
+    # Results answers are keyed by int question index
+    option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response instead of decoding to str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.option),
+            mimetype=self.mimetype,
+        )
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 # Generate a new secret key each time the app starts
 app.secret_key = str(uuid.uuid4())
+# Cache-busting version sent with every response, fixed for this server run
+APP_VERSION = uuid.uuid4().hex
+
+# Inline fill-in-the-blank markers, matched in a single scan
+INLINE_BLANK_RE = re.compile(r'___blank___|\[blank\]')
+
+# Pages that are static HTML shells - all quiz data is loaded by JavaScript
+PAGE_ENDPOINTS = {'selector', 'quiz', 'results'}
+
+# The host OS never changes while the server runs
+IS_MAC = platform.system() == "Darwin"
+
+# Terminal QR half-block characters, indexed by (top << 1 | bottom)
+HALF_BLOCKS = (' ', '▄', '▀', '█')
+
+# Keep session state on the server so only a short signed session id travels
+# in the cookie instead of the whole answer log on every request
+app.config['SESSION_TYPE'] = 'filesystem'
+app.config['SESSION_PERMANENT'] = False
+app.config['SESSION_USE_SIGNER'] = True
+app.config['SESSION_FILE_DIR'] = os.path.join(app.root_path, 'flask_session')
+# Session files outlive their cookie (the secret key changes on restart), so
+# expire them after a generous quiz sitting; expired files are pruned before
+# the threshold ever evicts a live session
+app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=12)
+app.config['SESSION_FILE_THRESHOLD'] = 5000
+Session(app)
 
+@lru_cache(maxsize=1)
 def get_local_ip():
     """Get the local IP address that can reach external networks"""
+    import socket
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         s.connect(("8.8.8.8", 80))
@@ -32,8 +82,13 @@ def get_local_ip():
     except Exception:
         return socket.gethostbyname(socket.gethostname())
 
-def generate_qr_code(url):
-    """Generate a QR code and return as base64 string"""
+@lru_cache(maxsize=32)
+def build_qr(url):
+    """Build the QR code for a URL, shared by the image and terminal renderers"""
+    # Startup-only helpers, so keep their imports out of every worker's import
+    import qrcode
+    
+    # box_size and border only affect the rendered image, not qr.modules
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -42,61 +97,56 @@ def generate_qr_code(url):
     )
     qr.add_data(url)
     qr.make(fit=True)
+    return qr
+
+@lru_cache(maxsize=32)
+def generate_qr_code(url):
+    """Generate a QR code and return as base64 string"""
+    import base64
+    from io import BytesIO
+    from qrcode.image.pure import PyPNGImage
     
-    img = qr.make_image(fill_color="black", back_color="white")
+    qr = build_qr(url)
+    # Black-on-white 1-bit PNG via pypng, no Pillow needed
+    img = qr.make_image(image_factory=PyPNGImage)
     
     # Convert to base64
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    img_str = base64.b64encode(buffer.getvalue()).decode()
+    with BytesIO() as buffer:
+        img.save(buffer)
+        img_str = base64.b64encode(buffer.getvalue()).decode()
     return img_str
 
 def print_qr_code_terminal(url):
     """Print QR code in terminal with OS-specific rendering"""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=1,
-        border=1,
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-    qr_matrix = qr.modules
+    qr_matrix = build_qr(url).modules
 
-    is_mac = platform.system() == "Darwin"
-
-    if is_mac:
+    if IS_MAC:
         # macOS-safe mode
-        for row in qr_matrix:
-            print(''.join('██' if cell else '  ' for cell in row))
+        rows = [''.join('██' if cell else '  ' for cell in row) for row in qr_matrix]
     else:
-        # Fancy half-block mode for Linux/Windows
-        for i in range(0, len(qr_matrix), 2):
-            line = ""
-            for j in range(len(qr_matrix[0])):
-                top = qr_matrix[i][j]
-                bottom = qr_matrix[i+1][j] if i+1 < len(qr_matrix) else False
-                if top and bottom:
-                    line += "█"
-                elif top:
-                    line += "▀"
-                elif bottom:
-                    line += "▄"
-                else:
-                    line += " "
-            print(line)
+        # Fancy half-block mode for Linux/Windows: each character covers two rows
+        height = len(qr_matrix)
+        blank_row = [False] * len(qr_matrix[0])
+        rows = []
+        for i in range(0, height, 2):
+            bottom_row = qr_matrix[i+1] if i+1 < height else blank_row
+            rows.append(''.join(HALF_BLOCKS[top << 1 | bottom]
+                                for top, bottom in zip(qr_matrix[i], bottom_row)))
+
+    # Emit the whole code in a single write
+    print('\n'.join(rows))
 
 def has_inline_blank(question_text):
     """Check if question text contains inline blank marker"""
-    return '___blank___' in question_text or '[blank]' in question_text
+    return INLINE_BLANK_RE.search(question_text) is not None
 
 def is_true_false_question(options):
     """Check if question is a True/False question"""
     if not options or len(options) != 2:
         return False
     
-    values = [str(v).lower().strip() for v in options.values()]
-    return set(values) == {'true', 'false'}
+    first, second = (str(v).lower().strip() for v in options.values())
+    return (first, second) in (('true', 'false'), ('false', 'true'))
 
 def shuffle_quiz_data(quiz_data):
     """
@@ -105,7 +155,10 @@ def shuffle_quiz_data(quiz_data):
     2. Answer options shuffled (for multiple choice and multiple answer)
     Note: True/False questions are NOT shuffled to maintain True, False order
     """
-    shuffled_data = copy.deepcopy(quiz_data)
+    # Only the question list and each question's options/correct_answer are
+    # replaced below, so copy those levels instead of deep-copying everything
+    shuffled_data = dict(quiz_data)
+    shuffled_data['questions'] = [dict(q) for q in quiz_data['questions']]
     
     # Shuffle questions
     random.shuffle(shuffled_data['questions'])
@@ -119,33 +172,24 @@ def shuffle_quiz_data(quiz_data):
             if is_true_false_question(options):
                 continue
             
-            # Create a list of (key, value) pairs
-            option_items = list(options.items())
-            
-            # Get correct answer(s)
+            # Get correct answer key(s)
             correct_answer = question.get('correct_answer')
             
-            # For multiple_choice, find the correct answer text
-            # For multiple_answer, find all correct answer texts
-            if question.get('type') == 'multiple_choice':
-                correct_answer_texts = [options.get(correct_answer)]
-            else:  # multiple_answer
-                if isinstance(correct_answer, list):
-                    correct_answer_texts = [options.get(ans) for ans in correct_answer]
-                else:
-                    correct_answer_texts = [options.get(correct_answer)]
+            # For multiple_choice, there is a single correct key
+            # For multiple_answer, there may be several
+            if question.get('type') == 'multiple_answer' and isinstance(correct_answer, list):
+                correct_keys = set(correct_answer)
+            else:
+                correct_keys = {correct_answer}
             
-            # Shuffle the options
-            random.shuffle(option_items)
+            # Shuffle the option keys
+            option_keys = list(options)
+            random.shuffle(option_keys)
             
-            # Rebuild the options dict with new indices
-            new_options = {}
-            new_correct_indices = []
-            for new_index, (old_key, value) in enumerate(option_items):
-                new_options[str(new_index)] = value
-                # Track the new index of correct answer(s)
-                if value in correct_answer_texts:
-                    new_correct_indices.append(str(new_index))
+            # Rebuild the options dict with new indices, tracking correct answer(s)
+            # by original key so options with identical text stay unambiguous
+            new_options = {str(i): options[key] for i, key in enumerate(option_keys)}
+            new_correct_indices = [str(i) for i, key in enumerate(option_keys) if key in correct_keys]
             
             # Update the question with shuffled options and new correct answer index/indices
             question['options'] = new_options
@@ -156,25 +200,61 @@ def shuffle_quiz_data(quiz_data):
     
     return shuffled_data
 
+def get_answer_texts(question, selected_answer):
+    """Return (selected_text, correct_text) for displaying an answer to a question"""
+    question_type = question.get('type', 'multiple_choice')
+    correct_answer = question.get('correct_answer')
+    
+    if question_type == 'multiple_answer':
+        options = question['options']
+        if not isinstance(correct_answer, list):
+            correct_answer = [correct_answer]
+        if not isinstance(selected_answer, list):
+            selected_answer = [selected_answer] if selected_answer else []
+        correct_text = ', '.join([options[ans] for ans in correct_answer])
+        selected_text = ', '.join([options[ans] for ans in selected_answer]) if selected_answer else 'None selected'
+    elif question_type == 'multiple_choice':
+        options = question['options']
+        correct_text = options[correct_answer]
+        selected_text = options[selected_answer] if selected_answer else 'None selected'
+    else:
+        correct_text = correct_answer if isinstance(correct_answer, str) else ', '.join(correct_answer)
+        selected_text = selected_answer
+    
+    return selected_text, correct_text
+
 @app.after_request
 def after_request(response):
-    """Add headers to prevent caching"""
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, public, max-age=0'
-    response.headers['Expires'] = '0'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['X-Version'] = str(uuid.uuid4())
+    """Set caching headers - API responses are never cached"""
+    # Static assets keep Flask's default conditional (ETag) caching
+    if request.endpoint == 'static':
+        return response
+    if request.endpoint in PAGE_ENDPOINTS:
+        # Page shells carry an ETag, so browsers revalidate and get a 304
+        response.headers['Cache-Control'] = 'no-cache'
+    else:
+        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, public, max-age=0'
+        response.headers['Expires'] = '0'
+        response.headers['Pragma'] = 'no-cache'
+    response.headers['X-Version'] = APP_VERSION
     return response
 
+def render_page(template_name):
+    """Render a static page shell with an ETag"""
+    response = make_response(render_template(template_name))
+    response.add_etag()
+    return response.make_conditional(request)
+
 @app.route('/')
 def selector():
     """Quiz selector page - quizzes now loaded from localStorage"""
-    return render_template('index.html')
+    return render_page('index.html')
 
 @app.route('/quiz')
 def quiz():
     """Main quiz page"""
     # Just render the page - quiz data will be loaded from localStorage via JavaScript
-    return render_template('quiz.html')
+    return render_page('quiz.html')
 
 @app.route('/submit_answer', methods=['POST'])
 def submit_answer():
@@ -222,76 +302,45 @@ def submit_answer():
         is_correct = selected_answer == correct_answer
     
     # Store answer
-    if 'answers' not in session:
-        session['answers'] = {}
+    answers = session.setdefault('answers', {})
     
-    # Get correct answer text for display
-    if question_type in ['multiple_choice', 'multiple_answer']:
-        if question_type == 'multiple_answer':
-            if isinstance(correct_answer, list):
-                correct_text = ', '.join([current_q['options'][ans] for ans in correct_answer])
-            else:
-                correct_text = current_q['options'][correct_answer]
-            
-            if isinstance(selected_answer, list):
-                selected_text = ', '.join([current_q['options'][ans] for ans in selected_answer]) if selected_answer else 'None selected'
-            else:
-                selected_text = current_q['options'][selected_answer] if selected_answer else 'None selected'
-        else:
-            correct_text = current_q['options'][correct_answer]
-            selected_text = current_q['options'][selected_answer] if selected_answer else 'None selected'
-    else:
-        correct_text = correct_answer if isinstance(correct_answer, str) else ', '.join(correct_answer)
-        selected_text = selected_answer
+    # Get answer text for display
+    selected_text, correct_text = get_answer_texts(current_q, selected_answer)
     
     # Get existing answer data if it exists
-    existing_answer = session['answers'].get(str(actual_q_index), {})
+    existing_answer = answers.get(actual_q_index, {})
     
     # Check if this question has been answered before
-    is_first_attempt = str(actual_q_index) not in session['answers']
+    is_first_attempt = actual_q_index not in answers
     
     # Track if this was a retry attempt
     was_retried = existing_answer.get('was_retried', False) or is_retry
     
-    # Store/update answer with retry information
-    session['answers'][str(actual_q_index)] = {
-        'selected': selected_text,
+    # Store/update answer with retry information - display text is rebuilt
+    # from the quiz data when results are requested
+    answers[actual_q_index] = {
         'selected_key': selected_answer,
-        'correct': correct_text,
-        'correct_key': correct_answer,
         'is_correct': is_correct,
-        'question': current_q['question'],
-        'question_type': question_type,
         'was_retried': was_retried,
         'first_attempt_correct': existing_answer.get('first_attempt_correct', is_correct and is_first_attempt)
     }
     
     # Track score and missed questions
     # IMPORTANT: Only increment score on FIRST attempt if correct
-    if is_first_attempt:
-        if is_correct:
+    missed = session.get('missed_questions', [])
+    if is_correct:
+        if is_first_attempt:
             session['score'] = session.get('score', 0) + 1
-        else:
-            # Add to missed questions for retry
-            missed = session.get('missed_questions', [])
-            if actual_q_index not in missed:
-                missed.append(actual_q_index)
-            session['missed_questions'] = missed
-    else:
-        # This is a retry - don't change the score, just update missed list
-        if is_correct:
-            # Remove from missed questions if now correct
-            missed = session.get('missed_questions', [])
-            if actual_q_index in missed:
-                missed.remove(actual_q_index)
-            session['missed_questions'] = missed
-        else:
-            # Still incorrect on retry - keep in missed questions
-            missed = session.get('missed_questions', [])
-            if actual_q_index not in missed:
-                missed.append(actual_q_index)
+        elif actual_q_index in missed:
+            # Correct on retry - remove from missed questions
+            missed.remove(actual_q_index)
             session['missed_questions'] = missed
+    elif actual_q_index not in missed:
+        # Missed on first attempt or still incorrect on retry - keep for retry
+        missed.append(actual_q_index)
+        session['missed_questions'] = missed
     
+    # session['answers'] is mutated in place, which the session can't detect
     session.modified = True
     
     response_data = {
@@ -307,59 +356,50 @@ def submit_answer():
 def next_question():
     """Move to next question"""
     session['current_question'] = session.get('current_question', 0) + 1
-    session.modified = True
     return jsonify({'success': True})
 
 @app.route('/results')
 def results():
     """Show final results - quiz data comes from localStorage"""
-    return render_template('results.html')
+    return render_page('results.html')
 
 @app.route('/restart')
 def restart():
     """Restart the quiz - just clear session, quiz data is in localStorage"""
     session.clear()
-    session.modified = True
     return redirect(url_for('quiz'))
 
 @app.route('/api/start_quiz', methods=['POST'])
 def start_quiz():
     """Start a quiz with data from localStorage"""
     try:
-        print("\n" + "="*60)
-        print("START_QUIZ ENDPOINT CALLED")
-        print("="*60)
-        
         # Get the JSON data from the request
         if not request.json:
-            print("ERROR: No JSON data in request")
+            app.logger.warning("start_quiz: no JSON data in request")
             return jsonify({'error': 'No data received'}), 400
         
-        print(f"Request JSON received: {bool(request.json)}")
-        
         quiz_data = request.json.get('quizData')
         
         if not quiz_data:
-            print("ERROR: No quizData in request JSON")
+            app.logger.warning("start_quiz: no quizData in request JSON")
             return jsonify({'error': 'No quiz data provided'}), 400
         
-        print(f"Quiz title: {quiz_data.get('title', 'No title')}")
-        print(f"Number of questions: {len(quiz_data.get('questions', []))}")
-        
         # Validate quiz data structure
         if 'questions' not in quiz_data or not isinstance(quiz_data['questions'], list):
-            print("ERROR: Invalid quiz data structure")
+            app.logger.warning("start_quiz: invalid quiz data structure")
             return jsonify({'error': 'Invalid quiz data structure'}), 400
         
         if len(quiz_data['questions']) == 0:
-            print("ERROR: No questions in quiz")
+            app.logger.warning("start_quiz: no questions in quiz")
             return jsonify({'error': 'Quiz must have at least one question'}), 400
         
-        print("Clearing session...")
+        app.logger.debug("start_quiz: %r (id %s) with %d questions",
+                         quiz_data.get('title', 'No title'), quiz_data.get('id'),
+                         len(quiz_data['questions']))
+        
         # Clear session
         session.clear()
         
-        print("Initializing minimal quiz session...")
         # Store only minimal data in session - NOT the full quiz
         session['current_question'] = 0
         session['score'] = 0
@@ -367,17 +407,9 @@ def start_quiz():
         session['missed_questions'] = []
         session['retry_mode'] = False
         session['retry_round'] = 0
-        session['start_time'] = datetime.now().isoformat()
+        session['start_time'] = time.time()
         session['quiz_id'] = quiz_data.get('id')  # Only store the ID
         
-        print(f"Session initialized with quiz_id: {quiz_data.get('id')}")
-        
-        # Force session to save
-        session.modified = True
-        
-        print("Session saved. Sending success response with quiz data.")
-        print("="*60 + "\n")
-        
         # Return the shuffled quiz data to the client
         shuffled = shuffle_quiz_data(quiz_data)
         
@@ -388,11 +420,8 @@ def start_quiz():
         })
         
     except Exception as e:
-        # Log the error for debugging
-        print(f"\n!!! ERROR in start_quiz: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        print()
+        # Log the error (with traceback) for debugging
+        app.logger.exception("Error in start_quiz")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/get_quiz_state', methods=['POST'])
@@ -407,41 +436,40 @@ def get_quiz_state():
         
         # Get session state
         current_q_num = session.get('current_question', 0)
+        retry_mode = session.get('retry_mode', False)
+        missed = session.get('missed_questions', [])
         total_questions = len(quiz_data['questions'])
         
         # Check if quiz is complete
-        if current_q_num >= total_questions and not session.get('retry_mode'):
-            missed = session.get('missed_questions', [])
+        if current_q_num >= total_questions and not retry_mode:
             if missed:
                 session['retry_mode'] = True
                 session['retry_round'] = session.get('retry_round', 0) + 1
                 session['current_question'] = 0
-                session.modified = True
                 return jsonify({
                     'redirect': url_for('quiz')
                 })
             else:
+                # The browser already holds the shuffled quiz for the results page
                 return jsonify({
-                    'redirect': url_for('results'),
-                    'quizData': quiz_data  # Send quiz data for results page
+                    'redirect': url_for('results')
                 })
         
         # Handle retry mode logic
-        if session.get('retry_mode'):
-            missed = session.get('missed_questions', [])
-            retry_q_num = session.get('current_question', 0)
+        if retry_mode:
+            retry_q_num = current_q_num
             
             if retry_q_num >= len(missed):
-                all_correct = all(session['answers'].get(str(q_idx), {}).get('is_correct') for q_idx in missed)
+                # Every missed question has an answer entry from its failed attempt
+                answers = session['answers']
+                all_correct = all(answers[q_idx]['is_correct'] for q_idx in missed)
                 if all_correct:
                     return jsonify({
-                        'redirect': url_for('results'),
-                        'quizData': quiz_data
+                        'redirect': url_for('results')
                     })
                 else:
                     session['retry_round'] = session.get('retry_round', 0) + 1
                     session['current_question'] = 0
-                    session.modified = True
                     return jsonify({
                         'redirect': url_for('quiz')
                     })
@@ -455,8 +483,7 @@ def get_quiz_state():
             q_index = current_q_num
             if q_index >= total_questions:
                 return jsonify({
-                    'redirect': url_for('results'),
-                    'quizData': quiz_data
+                    'redirect': url_for('results')
                 })
             current_q = quiz_data['questions'][q_index]
             question_num = current_q_num + 1
@@ -467,8 +494,6 @@ def get_quiz_state():
         is_inline_blank = (current_q.get('type') == 'fill_in_the_blank' and 
                            has_inline_blank(current_q.get('question', '')))
         
-        session.modified = True
-        
         return jsonify({
             'quiz_title': quiz_data.get('title', 'Quiz'),
             'current_question': current_q,
@@ -480,9 +505,7 @@ def get_quiz_state():
         })
         
     except Exception as e:
-        print(f"Error in get_quiz_state: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in get_quiz_state")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/get_results_data', methods=['POST'])
@@ -502,37 +525,43 @@ def get_results_data():
         start_time = session.get('start_time')
         time_taken_seconds = None
         if start_time:
-            try:
-                start = datetime.fromisoformat(start_time)
-                delta = datetime.now() - start
-                time_taken_seconds = int(delta.total_seconds())
-            except:
-                pass
+            time_taken_seconds = int(time.time() - start_time)
         
-        # Convert string keys back to integers for template compatibility
-        answers = session.get('answers', {})
-        converted_answers = {}
-        for key, value in answers.items():
-            converted_answers[int(key) if str(key).isdigit() else key] = value
+        # Rebuild display text for each answer from the quiz data
+        questions = quiz_data['questions']
+        answers = {}
+        for q_index, answer in session.get('answers', {}).items():
+            if q_index >= total:
+                continue
+            question = questions[q_index]
+            try:
+                selected_text, correct_text = get_answer_texts(question, answer['selected_key'])
+                question_text = question['question']
+            except (KeyError, TypeError):
+                # The posted quiz isn't the one that was answered (e.g. a stale
+                # resultsQuizData from an earlier quiz) - skip what doesn't match
+                continue
+            answers[q_index] = dict(answer,
+                                    question=question_text,
+                                    selected=selected_text,
+                                    correct=correct_text)
         
         return jsonify({
             'score': score,
             'total': total,
             'percentage': percentage,
-            'answers': converted_answers,
+            'answers': answers,
             'time_taken_seconds': time_taken_seconds,
             'retry_round': session.get('retry_round', 0)
         })
         
     except Exception as e:
-        print(f"Error in get_results_data: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in get_results_data")
         return jsonify({'error': str(e)}), 500
 
 def get_port():
     """Determine port based on system - 5001 for Mac, 5000 otherwise"""
-    return 5001 if platform.system() == "Darwin" else 5000
+    return 5001 if IS_MAC else 5000
 
 if __name__ == '__main__':
     # Determine port based on system
@@ -566,4 +595,7 @@ if __name__ == '__main__':
     print(f"  Network:  {network_url}")
     print("="*60 + "\n")
     
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    # The debugger and reloader are opt-in: they slow every request and the
+    # reloader runs a second copy of the app
+    debug = os.environ.get('FLASK_DEBUG') == '1'
+    app.run(host='0.0.0.0', port=port, debug=debug, use_reloader=debug)
\ No newline at end of file